@@ -4,60 +4,235 @@ FastAPI wrapper for Overleaf MCP Server.
 Exposes MCP tools as HTTP endpoints for ChatGPT integration.
 """
 
-from fastapi import FastAPI, HTTPException, Header, Depends
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Any, Optional
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
+from fastapi.responses import JSONResponse
+from functools import lru_cache
+from git import GitCommandError
+from pathlib import Path
+from pydantic import BaseModel
+from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import Any
+import asyncio
+import hmac
+import logging
+import orjson
 import os
 
-from .server import execute_tool, load_config
+from .server import execute_tool, get_config, list_tools, prewarm_repos, reload_config
+
+logger = logging.getLogger(__name__)
+
+# Required argument names per tool, from the MCP tool schemas
+REQUIRED_ARGUMENTS: dict[str, list[str]] = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the config and OpenAPI schema once per worker before serving requests."""
+    get_config()
+    get_api_key()
+    openapi_bytes()
+    prewarm_repos()
+    for tool in await list_tools():
+        REQUIRED_ARGUMENTS[tool.name] = tool.inputSchema.get("required", [])
+    yield
+
 
 # Create FastAPI app
 app = FastAPI(
     title="Overleaf MCP API",
     description="HTTP API for Overleaf LaTeX project management",
     version="1.0.0",
+    lifespan=lifespan,
+    # Schema and docs are served below from pre-serialized bytes
+    openapi_url=None,
+)
+
+# API Key authentication
+BEARER_PREFIX = b"Bearer "
+
+
+def load_api_key() -> bytes:
+    """Read the API key from the file in API_KEY_FILE, or from API_KEY."""
+    key_file = os.environ.get("API_KEY_FILE")
+    if key_file:
+        key = Path(key_file).read_bytes().strip()
+        # An empty file must not switch auth off, e.g. mid-rotation
+        if not key:
+            raise ValueError(f"API key file '{key_file}' is empty")
+        return key
+    return os.environ.get("API_KEY", "").encode()
+
+
+def api_key_mtime() -> int | None:
+    """Get the API key file's modification time, or None if not using one."""
+    key_file = os.environ.get("API_KEY_FILE")
+    if not key_file:
+        return None
+    try:
+        return Path(key_file).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+@lru_cache(maxsize=1)
+def load_api_key_cached(mtime: int | None) -> bytes:
+    """Load the API key once per key file version."""
+    return load_api_key()
+
+
+def get_api_key() -> bytes:
+    """Get the API key, re-reading the key file when it changes.
+
+    Every worker notices a rotated key file on its own, so a rotation
+    needs neither a restart nor a reload reaching each worker.
+    """
+    return load_api_key_cached(api_key_mtime())
+
+
+def reload_api_key() -> None:
+    """Drop the cached API key so the next request reads it again."""
+    load_api_key_cached.cache_clear()
+
+
+def auth_error(headers: list[tuple[bytes, bytes]], api_key: bytes) -> str | None:
+    """Return why the Authorization header is rejected, or None if valid."""
+    authorization = next((v for k, v in headers if k == b"authorization"), None)
+
+    if not authorization:
+        return "Missing Authorization header"
+
+    if not authorization.startswith(BEARER_PREFIX):
+        return "Invalid Authorization format"
+
+    token = authorization[len(BEARER_PREFIX):]
+    if not hmac.compare_digest(token, api_key):
+        return "Invalid API key"
+
+    return None
+
+
+class APIKeyMiddleware:
+    """Reject requests to protected paths that lack a valid API key.
+
+    Runs before routing and body parsing, so unauthorized requests are
+    answered without reading their payload.
+    """
+
+    def __init__(self, app: ASGIApp, protected_paths: frozenset[str]):
+        self.app = app
+        self.protected_paths = protected_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # No auth required if API_KEY not set
+        if scope["type"] == "http" and scope["path"] in self.protected_paths:
+            try:
+                api_key = get_api_key()
+            except (OSError, ValueError):
+                # A configured key file that can't be read fails closed
+                response = JSONResponse(status_code=500, content={"detail": "API key unavailable"})
+                await response(scope, receive, send)
+                return
+
+            error = auth_error(scope["headers"], api_key) if api_key else None
+            if error:
+                response = JSONResponse(status_code=401, content={"detail": error})
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+
+# Tool endpoints: (method, path, tool name, requires auth, description)
+TOOL_ROUTES = [
+    # === CREATE OPERATIONS ===
+    ("POST", "/projects/create", "create_project", True, "Create a new Overleaf project."),
+    ("POST", "/files/create", "create_file", True, "Create a new file in a project."),
+
+    # === READ OPERATIONS ===
+    ("GET", "/projects", "list_projects", False, "List all configured projects."),
+    ("POST", "/files/list", "list_files", False, "List files in a project."),
+    ("POST", "/files/read", "read_file", False, "Read a file's content."),
+    ("POST", "/sections/list", "get_sections", False, "Get sections from a LaTeX file."),
+    ("POST", "/sections/read", "get_section_content", False, "Get content of a specific section."),
+    ("POST", "/history", "list_history", False, "Get git commit history."),
+    ("POST", "/diff", "get_diff", False, "Get git diff."),
+
+    # === UPDATE OPERATIONS ===
+    ("POST", "/files/edit", "edit_file", True, "Edit a file with surgical replacement."),
+    ("POST", "/files/rewrite", "rewrite_file", True, "Rewrite entire file content."),
+    ("POST", "/sections/update", "update_section", True, "Update a specific section."),
+    ("POST", "/projects/sync", "sync_project", True, "Sync project with Overleaf."),
+
+    # === DELETE OPERATIONS ===
+    ("POST", "/files/delete", "delete_file", True, "Delete a file from the project."),
+]
+
+# Write tools that may be queued with ?async=true instead of awaited
+BACKGROUND_TOOLS = frozenset(["create_file", "sync_project", "delete_file"])
+
+PROTECTED_PATHS = frozenset(
+    [path for _, path, _, requires_auth, _ in TOOL_ROUTES if requires_auth]
+    + ["/admin/reload"]
 )
 
+# Auth is added first so CORS stays outermost and still answers preflights
+app.add_middleware(APIKeyMiddleware, protected_paths=PROTECTED_PATHS)
+
 # CORS configuration for ChatGPT
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://chat.openai.com", "https://chatgpt.com"],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,
 )
 
-# API Key authentication
-API_KEY = os.environ.get("API_KEY", "")
-
-
-def verify_api_key(authorization: Optional[str] = Header(None)):
-    """Verify API key from Authorization header."""
-    if not API_KEY:
-        return  # No auth required if API_KEY not set
-    
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Authorization header")
-    
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid Authorization format")
-    
-    token = authorization.replace("Bearer ", "")
-    if token != API_KEY:
-        raise HTTPException(status_code=401, detail="Invalid API key")
-
 
 # Request/Response models
 class ToolRequest(BaseModel):
     """Generic tool execution request."""
-    arguments: dict[str, Any] = Field(default_factory=dict)
+    # Pydantic copies mutable defaults, so a plain {} is safe here
+    arguments: dict[str, Any] = {}
 
 
 class ToolResponse(BaseModel):
     """Generic tool execution response."""
     result: str
-    success: bool = True
+
+
+class BatchItem(BaseModel):
+    """A single tool call within a batch request."""
+    tool: str
+    arguments: dict[str, Any] = {}
+
+
+class BatchResult(BaseModel):
+    """Outcome of one batched tool call: a result or an error."""
+    result: str | None = None
+    error: str | None = None
+
+
+# Errors raised by tools for bad input or failed git/file operations
+TOOL_ERRORS = (ValueError, KeyError, TypeError, OSError, GitCommandError)
+
+
+async def tool_error_handler(request: Request, exc: Exception) -> JSONResponse:
+    """Convert a tool failure into a 400 response."""
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
+for exc_class in TOOL_ERRORS:
+    app.add_exception_handler(exc_class, tool_error_handler)
+
+
+# Cache lifetimes (seconds) for idempotent GET endpoints polled by clients
+HEALTH_MAX_AGE = 10
+PROJECTS_MAX_AGE = 30
 
 
 # Health check
@@ -68,9 +243,10 @@ async def root():
 
 
 @app.get("/health")
-async def health():
+async def health(response: Response):
     """Detailed health check."""
-    config = load_config()
+    response.headers["Cache-Control"] = f"max-age={HEALTH_MAX_AGE}"
+    config = get_config()
     return {
         "status": "healthy",
         "projects_configured": len(config.projects),
@@ -78,154 +254,160 @@ async def health():
     }
 
 
-# === CREATE OPERATIONS ===
-
-@app.post("/projects/create", response_model=ToolResponse)
-async def create_project(request: ToolRequest, _: None = Depends(verify_api_key)):
-    """Create a new Overleaf project."""
-    try:
-        result = await execute_tool("create_project", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-
-@app.post("/files/create", response_model=ToolResponse)
-async def create_file(request: ToolRequest, _: None = Depends(verify_api_key)):
-    """Create a new file in a project."""
-    try:
-        result = await execute_tool("create_file", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
+@app.post("/admin/reload")
+async def reload():
+    """Reload the project configuration and API key."""
+    config = reload_config()
+    reload_api_key()
+    return {
+        "status": "reloaded",
+        "projects_configured": len(config.projects),
+        "default_project": config.default_project,
+    }
 
-# === READ OPERATIONS ===
 
-@app.get("/projects", response_model=ToolResponse)
-async def list_projects():
-    """List all configured projects."""
-    try:
-        result = await execute_tool("list_projects", {})
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+async def dispatch(tool_name: str, arguments: dict[str, Any]) -> ToolResponse:
+    """Run a tool and wrap its result in a ToolResponse."""
+    # The result is built by us, so skip validation; FastAPI passes an
+    # instance of the response model through without validating it again
+    return ToolResponse.model_construct(result=await execute_tool(tool_name, arguments))
 
 
-@app.post("/files/list", response_model=ToolResponse)
-async def list_files(request: ToolRequest):
-    """List files in a project."""
-    try:
-        result = await execute_tool("list_files", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+async def read_arguments(request: Request) -> dict[str, Any]:
+    """Parse the ToolRequest body straight from the raw bytes."""
+    body = await request.body()
+    payload = orjson.loads(body) if body else {}
+    arguments = payload.get("arguments", {}) if isinstance(payload, dict) else None
+    if not isinstance(arguments, dict):
+        raise ValueError("Request body must be a JSON object with an 'arguments' object")
+    return arguments
 
 
-@app.post("/files/read", response_model=ToolResponse)
-async def read_file(request: ToolRequest):
-    """Read a file's content."""
-    try:
-        result = await execute_tool("read_file", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+# Bodies are parsed by read_arguments, so document ToolRequest by hand
+TOOL_REQUEST_BODY = {
+    "requestBody": {
+        "content": {"application/json": {"schema": ToolRequest.model_json_schema()}},
+    },
+}
 
 
-@app.post("/sections/list", response_model=ToolResponse)
-async def get_sections(request: ToolRequest):
-    """Get sections from a LaTeX file."""
+async def run_in_background(tool_name: str, arguments: dict[str, Any]) -> None:
+    """Run a queued tool call, logging failures since no client awaits it."""
     try:
-        result = await execute_tool("get_sections", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        result = await execute_tool(tool_name, arguments)
+    except Exception:
+        logger.exception("Background %s failed", tool_name)
+        return
+    if result.startswith("Error"):
+        logger.warning("Background %s failed: %s", tool_name, result)
+
+
+def make_endpoint(tool_name: str, method: str):
+    """Build the endpoint function for a tool route."""
+    if method == "GET":
+        async def endpoint(response: Response):
+            response.headers["Cache-Control"] = f"max-age={PROJECTS_MAX_AGE}"
+            return await dispatch(tool_name, {})
+    elif tool_name in BACKGROUND_TOOLS:
+        async def endpoint(
+            request: Request,
+            background_tasks: BackgroundTasks,
+            run_async: bool = Query(False, alias="async"),
+        ):
+            arguments = await read_arguments(request)
+            if run_async:
+                # Reject what would certainly fail before reporting it queued
+                missing = [key for key in REQUIRED_ARGUMENTS.get(tool_name, []) if key not in arguments]
+                if missing:
+                    raise ValueError(f"Missing required arguments: {', '.join(missing)}")
+                # Runs after the response is sent, on the shared tool executor
+                background_tasks.add_task(run_in_background, tool_name, arguments)
+                return JSONResponse(
+                    status_code=202,
+                    content={"result": f"Queued {tool_name}"},
+                )
+            return await dispatch(tool_name, arguments)
+    else:
+        async def endpoint(request: Request):
+            return await dispatch(tool_name, await read_arguments(request))
+
+    endpoint.__name__ = tool_name
+    return endpoint
+
+
+for method, path, tool_name, _, description in TOOL_ROUTES:
+    app.add_api_route(
+        path,
+        make_endpoint(tool_name, method),
+        methods=[method],
+        response_model=ToolResponse,
+        name=tool_name,
+        description=description,
+        openapi_extra=TOOL_REQUEST_BODY if method == "POST" else None,
+    )
+
+
+# === BATCH OPERATIONS ===
+
+# Only read-only tools may be batched, since batched calls run concurrently
+BATCH_TOOLS = frozenset(
+    tool_name for _, _, tool_name, requires_auth, _ in TOOL_ROUTES if not requires_auth
+)
+MAX_BATCH_SIZE = 20
 
 
-@app.post("/sections/read", response_model=ToolResponse)
-async def get_section_content(request: ToolRequest):
-    """Get content of a specific section."""
+async def run_batch_item(item: BatchItem) -> dict[str, Any]:
+    """Run one batched tool call, capturing failures as an error entry."""
+    if item.tool not in BATCH_TOOLS:
+        return {"error": f"Tool '{item.tool}' cannot be batched"}
     try:
-        result = await execute_tool("get_section_content", request.arguments)
-        return ToolResponse(result=result)
+        return {"result": await execute_tool(item.tool, item.arguments)}
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        return {"error": str(e)}
 
 
-@app.post("/history", response_model=ToolResponse)
-async def list_history(request: ToolRequest):
-    """Get git commit history."""
-    try:
-        result = await execute_tool("list_history", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+@app.post("/batch", response_model=list[BatchResult], response_model_exclude_none=True)
+async def batch(items: list[BatchItem]):
+    """Run several read-only tool calls concurrently in one request."""
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f"Batch accepts at most {MAX_BATCH_SIZE} tool calls")
+    return await asyncio.gather(*(run_batch_item(item) for item in items))
 
 
-@app.post("/diff", response_model=ToolResponse)
-async def get_diff(request: ToolRequest):
-    """Get git diff."""
-    try:
-        result = await execute_tool("get_diff", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-
-# === UPDATE OPERATIONS ===
-
-@app.post("/files/edit", response_model=ToolResponse)
-async def edit_file(request: ToolRequest, _: None = Depends(verify_api_key)):
-    """Edit a file with surgical replacement."""
-    try:
-        result = await execute_tool("edit_file", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+# === OPENAPI SCHEMA AND DOCS ===
 
+OPENAPI_URL = "/openapi.json"
 
-@app.post("/files/rewrite", response_model=ToolResponse)
-async def rewrite_file(request: ToolRequest, _: None = Depends(verify_api_key)):
-    """Rewrite entire file content."""
-    try:
-        result = await execute_tool("rewrite_file", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
 
+@lru_cache(maxsize=1)
+def openapi_bytes() -> bytes:
+    """Generate and serialize the OpenAPI schema once."""
+    return orjson.dumps(app.openapi())
 
-@app.post("/sections/update", response_model=ToolResponse)
-async def update_section(request: ToolRequest, _: None = Depends(verify_api_key)):
-    """Update a specific section."""
-    try:
-        result = await execute_tool("update_section", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
 
+@app.get(OPENAPI_URL, include_in_schema=False)
+async def openapi_schema():
+    """Serve the pre-serialized OpenAPI schema."""
+    return Response(openapi_bytes(), media_type="application/json")
 
-@app.post("/projects/sync", response_model=ToolResponse)
-async def sync_project(request: ToolRequest, _: None = Depends(verify_api_key)):
-    """Sync project with Overleaf."""
-    try:
-        result = await execute_tool("sync_project", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/docs", include_in_schema=False)
+async def swagger_docs():
+    """Swagger UI for the API."""
+    return get_swagger_ui_html(openapi_url=OPENAPI_URL, title=f"{app.title} - Swagger UI")
 
-# === DELETE OPERATIONS ===
 
-@app.post("/files/delete", response_model=ToolResponse)
-async def delete_file(request: ToolRequest, _: None = Depends(verify_api_key)):
-    """Delete a file from the project."""
-    try:
-        result = await execute_tool("delete_file", request.arguments)
-        return ToolResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+@app.get("/redoc", include_in_schema=False)
+async def redoc_docs():
+    """ReDoc documentation for the API."""
+    return get_redoc_html(openapi_url=OPENAPI_URL, title=f"{app.title} - ReDoc")
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "overleaf_mcp.fastapi_server:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 2)),
+    )
@@ -4,11 +4,13 @@ Simple test script for the Overleaf MCP API.
 Tests both local and remote deployments.
 """
 
+import asyncio
+import os
 import sys
-import requests
+import httpx
 import json
 
-def test_api(base_url: str, api_key: str = None):
+async def test_api(base_url: str, api_key: str = None):
     """Test the API endpoints."""
     
     headers = {"Content-Type": "application/json"}
@@ -17,85 +19,78 @@ def test_api(base_url: str, api_key: str = None):
     
     print(f"Testing API at: {base_url}\n")
     
+    # The probes are independent, so send them all at once over one client.
+    # No timeout: on a fresh server they queue behind the first clone.
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=None) as client:
+        health, projects, files, main_tex = await asyncio.gather(
+            client.get("/health"),
+            client.get("/projects"),
+            client.post("/files/list", json={"arguments": {}}),
+            client.post("/files/read", json={"arguments": {"file_path": "main.tex"}}),
+            return_exceptions=True,
+        )
+    
     # Test 1: Health check
     print("1. Testing health endpoint...")
-    try:
-        response = requests.get(f"{base_url}/health")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"   ✓ Health check passed")
-            print(f"   Status: {data.get('status')}")
-            print(f"   Projects configured: {data.get('projects_configured')}")
-        else:
-            print(f"   ✗ Health check failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"   ✗ Error: {e}")
+    if isinstance(health, Exception):
+        print(f"   ✗ Error: {health}")
+        return False
+    if health.status_code == 200:
+        data = health.json()
+        print(f"   ✓ Health check passed")
+        print(f"   Status: {data.get('status')}")
+        print(f"   Projects configured: {data.get('projects_configured')}")
+    else:
+        print(f"   ✗ Health check failed: {health.status_code}")
         return False
     
     print()
     
     # Test 2: List projects
     print("2. Testing list projects...")
-    try:
-        response = requests.get(f"{base_url}/projects")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"   ✓ List projects passed")
-            print(f"   Result preview: {data.get('result', '')[:100]}...")
-        else:
-            print(f"   ✗ List projects failed: {response.status_code}")
-    except Exception as e:
-        print(f"   ✗ Error: {e}")
+    if isinstance(projects, Exception):
+        print(f"   ✗ Error: {projects}")
+    elif projects.status_code == 200:
+        data = projects.json()
+        print(f"   ✓ List projects passed")
+        print(f"   Result preview: {data.get('result', '')[:100]}...")
+    else:
+        print(f"   ✗ List projects failed: {projects.status_code}")
     
     print()
     
     # Test 3: List files (requires auth if API_KEY is set)
     print("3. Testing list files...")
-    try:
-        payload = {"arguments": {}}
-        response = requests.post(
-            f"{base_url}/files/list",
-            headers=headers,
-            json=payload
-        )
-        if response.status_code == 200:
-            data = response.json()
-            print(f"   ✓ List files passed")
-            print(f"   Result preview: {data.get('result', '')[:100]}...")
-        elif response.status_code == 401:
-            print(f"   ⚠ Authentication required (this is expected if API_KEY is set)")
-        else:
-            print(f"   ✗ List files failed: {response.status_code}")
-            print(f"   Response: {response.text[:200]}")
-    except Exception as e:
-        print(f"   ✗ Error: {e}")
+    if isinstance(files, Exception):
+        print(f"   ✗ Error: {files}")
+    elif files.status_code == 200:
+        data = files.json()
+        print(f"   ✓ List files passed")
+        print(f"   Result preview: {data.get('result', '')[:100]}...")
+    elif files.status_code == 401:
+        print(f"   ⚠ Authentication required (this is expected if API_KEY is set)")
+    else:
+        print(f"   ✗ List files failed: {files.status_code}")
+        print(f"   Response: {files.text[:200]}")
     
     print()
     
     # Test 4: Read file (if we know a file exists)
     print("4. Testing read file (main.tex)...")
-    try:
-        payload = {"arguments": {"file_path": "main.tex"}}
-        response = requests.post(
-            f"{base_url}/files/read",
-            headers=headers,
-            json=payload
-        )
-        if response.status_code == 200:
-            data = response.json()
-            print(f"   ✓ Read file passed")
-            result = data.get('result', '')
-            if len(result) > 100:
-                print(f"   Content preview: {result[:100]}...")
-            else:
-                print(f"   Content: {result}")
-        elif response.status_code == 401:
-            print(f"   ⚠ Authentication required")
+    if isinstance(main_tex, Exception):
+        print(f"   ✗ Error: {main_tex}")
+    elif main_tex.status_code == 200:
+        data = main_tex.json()
+        print(f"   ✓ Read file passed")
+        result = data.get('result', '')
+        if len(result) > 100:
+            print(f"   Content preview: {result[:100]}...")
         else:
-            print(f"   ⚠ File might not exist or other error: {response.status_code}")
-    except Exception as e:
-        print(f"   ✗ Error: {e}")
+            print(f"   Content: {result}")
+    elif main_tex.status_code == 401:
+        print(f"   ⚠ Authentication required")
+    else:
+        print(f"   ⚠ File might not exist or other error: {main_tex.status_code}")
     
     print()
     print("=" * 60)
@@ -122,7 +117,6 @@ if __name__ == "__main__":
         api_key = sys.argv[2]
     
     # Check for API key in environment
-    import os
     if not api_key:
         api_key = os.environ.get("API_KEY")
     
@@ -138,4 +132,4 @@ if __name__ == "__main__":
     
     print()
     
-    test_api(base_url, api_key)
+    asyncio.run(test_api(base_url, api_key))